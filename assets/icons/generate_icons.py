@@ -2,6 +2,20 @@
 """
 Generate all iOS/Web icon sizes from source-logo.png.
 
+Usage:
+  python generate_icons.py            # from source-logo.png
+  python generate_icons.py --svg      # from icon-source.svg (needs cairosvg)
+  python generate_icons.py --force    # rebuild even if .icons-stamp matches
+  python generate_icons.py --release  # fully optimized PNGs for shipping
+
+By default PNGs are written with fast zlib settings (compress_level=1)
+for quick iteration. --release optimizes them for size and always
+regenerates.
+
+Each build records its source, the source's hash, LOGO_FILL and a hash
+of this script in .icons-stamp. Nothing is regenerated while all icons
+exist and the stamp still matches; pass --force to rebuild anyway.
+
 Strategy:
   - Do NOT auto-crop the source. The logo image already has appropriate
     black margins built in by the designer.
@@ -10,18 +24,53 @@ Strategy:
   - Center on a pure black (#000000) square canvas.
   - Aspect ratio is NEVER altered (source must be square; if not, it is
     letterboxed symmetrically).
+  - The source is downscaled once to the largest logo size needed, and
+    every icon is resized from that intermediate instead of the full
+    source, so Lanczos cost no longer scales with the source resolution.
+  - Icons are generated concurrently on a thread pool; Pillow releases
+    the GIL while resampling and zlib-encoding, so threads scale without
+    having to pickle the image into worker processes.
+
+Requirements:
+  - Pillow. On x86-64 machines with SSE4/AVX2, pillow-simd is a drop-in
+    replacement with vectorized resampling and needs no code changes:
+        pip uninstall pillow && pip install pillow-simd
+    Stay on stock Pillow on ARM/aarch64, where pillow-simd has no benefit.
+  - cairosvg (only for --svg). Each logo is rasterized directly at its
+    target pixel size, so no resampling happens at all.
+  - oxipng (optional, --release only). If it is on PATH, release icons
+    are optimized in a single multi-threaded "oxipng -o max" pass;
+    otherwise Pillow's own optimize=True encoder is used.
 """
+import argparse
+import hashlib
+import io
+import os
+import shutil
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from PIL import Image
 
 SCRIPT_DIR = Path(__file__).parent
 SRC        = SCRIPT_DIR / "source-logo.png"
+SVG_SRC    = SCRIPT_DIR / "icon-source.svg"
+STAMP      = SCRIPT_DIR / ".icons-stamp"
 
 # Logo (including its built-in padding) fills this fraction of each icon.
 # 0.85 → 7.5 % black margin added on every side by us,
 # plus whatever natural padding the source image already contains.
 LOGO_FILL = 0.85
 
+# Icons at or below this size are resampled with BICUBIC; the wider
+# Lanczos kernel gives no visible gain at favicon scale.
+SMALL_ICON_MAX = 64
+
+# Passed to Image.resize(): large reductions are first box-reduced with
+# Image.reduce() to within this factor of the target, then finished with
+# the real filter. 3.0 is visually indistinguishable from a plain resize.
+REDUCING_GAP = 3.0
+
 ICONS = [
     # AppIcon.appiconset (Xcode)
     ("AppIcon.appiconset/icon-20@2x.png",    40),
@@ -46,11 +95,14 @@ ICONS = [
 ]
 
 
-def make_icon(src: Image.Image, out_path: Path, icon_size: int, fill: float):
+def make_icon(src: Image.Image, out_path: Path, icon_size: int, fill: float,
+              optimize: bool = True):
     """
     Place src (with its natural padding) onto a black square canvas.
     The longer side of src maps to (icon_size * fill) pixels.
     Aspect ratio is strictly preserved.
+    With optimize=False the PNG is written with fast compression, for
+    development builds or a later oxipng pass.
     """
     src_w, src_h = src.size
     # Scale so the longer side equals inner_size
@@ -59,29 +111,169 @@ def make_icon(src: Image.Image, out_path: Path, icon_size: int, fill: float):
     new_w  = round(src_w * scale)
     new_h  = round(src_h * scale)
 
-    resized = src.resize((new_w, new_h), Image.LANCZOS)
+    if src.size == (new_w, new_h):
+        # Already the right size (the prescaled base for the largest icon).
+        resized = src
+    else:
+        filt    = Image.LANCZOS if icon_size > SMALL_ICON_MAX else Image.BICUBIC
+        resized = src.resize((new_w, new_h), filt, reducing_gap=REDUCING_GAP)
 
-    canvas   = Image.new("RGB", (icon_size, icon_size), (0, 0, 0))
+    # Cropping past the image bounds pads with zeros, i.e. black, so this
+    # centers the logo on the canvas in one copy with no separate paste.
     x_offset = (icon_size - new_w) // 2
     y_offset = (icon_size - new_h) // 2
-    canvas.paste(resized, (x_offset, y_offset))
+    canvas   = resized.crop((-x_offset, -y_offset,
+                             icon_size - x_offset, icon_size - y_offset))
 
+    # Encode in memory and write the file in one call.
+    buf = io.BytesIO()
+    if optimize:
+        canvas.save(buf, "PNG", optimize=True, compress_level=9)
+    else:
+        canvas.save(buf, "PNG", compress_level=1)
     out_path.parent.mkdir(parents=True, exist_ok=True)
-    canvas.save(str(out_path), "PNG", optimize=True)
+    out_path.write_bytes(buf.getvalue())
+
+
+def oxipng(paths: list[Path]):
+    """Losslessly optimize paths in place with one oxipng invocation."""
+    subprocess.run(
+        ["oxipng", "-o", "max", "--strip", "safe", "-t", str(os.cpu_count() or 1),
+         *map(str, paths)],
+        check=True,
+    )
+
+
+def prescale(src: Image.Image, max_inner: int) -> Image.Image:
+    """
+    Downscale src so its longer side is max_inner pixels.
+    src is returned unchanged if it is already that small.
+    """
+    src_w, src_h = src.size
+    if max(src_w, src_h) <= max_inner:
+        return src
+    scale = max_inner / max(src_w, src_h)
+    return src.resize((round(src_w * scale), round(src_h * scale)), Image.LANCZOS,
+                      reducing_gap=REDUCING_GAP)
+
+
+def rasterize_svg(svg: bytes, size: int) -> Image.Image:
+    """
+    Render svg to a size x size RGB image, composited over black.
+    """
+    import cairosvg
+
+    png  = cairosvg.svg2png(bytestring=svg, output_width=size, output_height=size)
+    logo = Image.open(io.BytesIO(png)).convert("RGBA")
+    flat = Image.new("RGB", logo.size, (0, 0, 0))
+    flat.paste(logo, mask=logo)
+    return flat
+
+
+def build_stamp(source: Path) -> str:
+    """
+    Describe the inputs of a build: which source, its content, the fill
+    and this script (for ICONS and the resampling settings).
+    """
+    return (
+        f"source {source.name}\n"
+        f"sha256 {hashlib.sha256(source.read_bytes()).hexdigest()}\n"
+        f"fill   {LOGO_FILL}\n"
+        f"script {hashlib.sha256(Path(__file__).read_bytes()).hexdigest()}\n"
+    )
+
+
+def up_to_date(outputs: list[Path], stamp: str) -> bool:
+    """True if every output exists and STAMP matches the given build inputs."""
+    return (STAMP.exists() and STAMP.read_text() == stamp
+            and all(p.exists() for p in outputs))
 
 
 def main():
-    src = Image.open(SRC).convert("RGB")
-    print(f"Source : {SRC.name}  {src.size[0]}x{src.size[1]}")
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--svg", action="store_true",
+                        help=f"render from {SVG_SRC.name} instead of {SRC.name}")
+    parser.add_argument("--force", action="store_true",
+                        help=f"regenerate even if {STAMP.name} matches")
+    parser.add_argument("--release", action="store_true",
+                        help="optimize PNG size (slow); implies --force")
+    args = parser.parse_args()
+
+    if args.svg:
+        # Fail fast, before the stamp is touched, rather than from a worker.
+        try:
+            import cairosvg  # noqa: F401
+        except (ImportError, OSError):
+            parser.error("--svg needs cairosvg (pip install cairosvg) "
+                         "and the cairo library")
+
+    source  = SVG_SRC if args.svg else SRC
+    outputs = [SCRIPT_DIR / rel_path for rel_path, _ in ICONS]
+    stamp   = build_stamp(source)
+    if not (args.force or args.release) and up_to_date(outputs, stamp):
+        print(f"Up to date: {len(ICONS)} icons were built from {source.name}.")
+        return
+    # Invalidate first so an interrupted build is never considered current.
+    STAMP.unlink(missing_ok=True)
+
+    # Largest first, each resized from a single shared intermediate.
+    icons = sorted(ICONS, key=lambda icon: -icon[1])
+
+    if args.svg:
+        svg = SVG_SRC.read_bytes()
+        print(f"Source : {SVG_SRC.name}  (vector)")
+    else:
+        src = Image.open(SRC)
+        # Decode up front: the image is shared by the worker threads below.
+        src.load()
+        if src.mode != "RGB":
+            src = src.convert("RGB")
+        base = prescale(src, int(icons[0][1] * LOGO_FILL))
+        print(f"Source : {SRC.name}  {src.size[0]}x{src.size[1]}")
     print(f"Fill   : {LOGO_FILL:.0%}  (margin each side: {(1-LOGO_FILL)/2:.1%})")
 
+    use_oxipng = args.release and shutil.which("oxipng") is not None
+    optimize   = args.release and not use_oxipng
+    if not args.release:
+        print("PNG    : fast (compress_level=1)")
+    else:
+        print(f"PNG    : {'oxipng -o max' if use_oxipng else 'Pillow optimize'}")
+
+    # Sizes shared by several files (120, 180) are rendered once and copied.
+    by_size: dict[int, list[Path]] = {}
+    for rel_path, icon_size in icons:
+        by_size.setdefault(icon_size, []).append(SCRIPT_DIR / rel_path)
+
+    def render(icon_size):
+        out = by_size[icon_size][0]
+        if args.svg:
+            # Rendered at the exact inner size, so make_icon won't resample.
+            logo = rasterize_svg(svg, int(icon_size * LOGO_FILL))
+        else:
+            logo = base
+        make_icon(logo, out, icon_size, LOGO_FILL, optimize=optimize)
+        return out
+
+    with ThreadPoolExecutor() as pool:
+        rendered = list(pool.map(render, by_size))
+
+    if use_oxipng:
+        oxipng(rendered)
+
+    for first, *copies in by_size.values():
+        for out in copies:
+            out.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copyfile(first, out)
+
+    # Report in ICONS order, independent of the render schedule above.
     for rel_path, icon_size in ICONS:
         out = SCRIPT_DIR / rel_path
-        make_icon(src, out, icon_size, LOGO_FILL)
-        result = Image.open(out)
-        ok = "OK" if result.size == (icon_size, icon_size) else "NG"
-        print(f"  [{ok}] {out.name:<35} {result.size[0]}x{result.size[1]}")
+        # The canvas is (icon_size, icon_size) by construction, so there is
+        # no need to decode the PNG again just to check its size.
+        ok = "OK" if out.stat().st_size > 0 else "NG"
+        print(f"  [{ok}] {out.name:<35} {icon_size}x{icon_size}")
 
+    STAMP.write_text(stamp)
     print(f"\nDone. {len(ICONS)} icons generated.")
 
 